@@ -0,0 +1,98 @@
+import logging
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from itertools import groupby
+
+log = logging.getLogger(__name__)
+
+# -----------------------
+# Escritor SQLite em segundo plano
+# -----------------------
+
+class DBWriter:
+    """Único escritor da base de dados.
+
+    As escritas (INSERT/UPDATE/DELETE) são postas numa fila e gravadas por uma
+    thread própria, com a sua ligação. Tudo o que estiver na fila (até
+    ``batch_size`` linhas) é gravado numa só transação, logo que a fila esvazia.
+    Cada ``submit`` devolve um ``Future`` cujo resultado tem, para cada linha,
+    ``None`` se foi gravada ou a exceção que a impediu.
+    """
+
+    def __init__(self, db_path, batch_size=500):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        # Aberta aqui para que um caminho inválido falhe já, e não dentro da thread.
+        # Depois disto só a thread do escritor a usa.
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, sql, rows):
+        if not self.thread.is_alive():
+            raise RuntimeError("O escritor da base de dados já não está a correr")
+        future = Future()
+        self.queue.put((sql, list(rows), future))
+        return future
+
+    def _run(self):
+        conn = self.conn
+        while True:
+            batch = [self.queue.get()]
+            try:
+                self._write_batch(conn, batch)
+            except Exception as e:
+                # Nenhum Future pode ficar por resolver, senão quem espera bloqueia.
+                log.exception("Erro inesperado no escritor da base de dados")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _write_batch(self, conn, batch):
+        size = len(batch[0][1])
+        while size < self.batch_size:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[1])
+
+        try:
+            # Escritas consecutivas com o mesmo SQL seguem num só executemany.
+            self._write(conn, [(sql, [row for _, rows, _ in group for row in rows])
+                               for sql, group in groupby(batch, key=lambda item: item[0])])
+        except Exception:
+            # Repete cada escrita à parte: só se perdem as linhas com erro.
+            for sql, rows, future in batch:
+                future.set_result(self._write_rows(conn, sql, rows))
+        else:
+            for _, rows, future in batch:
+                future.set_result([None] * len(rows))
+
+    def _write_rows(self, conn, sql, rows):
+        try:
+            self._write(conn, [(sql, rows)])
+            return [None] * len(rows)
+        except Exception:
+            pass
+        results = []
+        for row in rows:
+            try:
+                self._write(conn, [(sql, [row])])
+                results.append(None)
+            except Exception as e:
+                log.warning("Falha ao gravar uma linha na base de dados: %s", e)
+                results.append(e)
+        return results
+
+    @staticmethod
+    def _write(conn, groups):
+        with conn:
+            for sql, rows in groups:
+                conn.executemany(sql, rows)
@@ -0,0 +1,122 @@
+import re
+from datetime import datetime
+
+import pypdfium2 as pdfium
+
+# -----------------------
+# Funções auxiliares
+# -----------------------
+
+_DATE_RE = re.compile(r"(\d{2}[/-]\d{2}[/-]\d{4})")
+# Uma única passagem pelo texto; a prioridade entre prefixos é resolvida em
+# _total_priority (o "TOTAL" também apanha "Valor total", tal como antes).
+_TOTAL_RE = re.compile(
+    r"(?:(?P<pagar>Total a pagar)|Valor total|TOTAL)\s*[:\-]?\s*"
+    r"(?P<val>[0-9]+[.,][0-9]{2})(?P<euro>\s*€)?",
+    re.IGNORECASE,
+)
+_NUM_RE = re.compile(r"[0-9]+[.,][0-9]{2}")
+# Mesma conversão que .replace('.', '').replace(',', '.'), numa só passagem.
+_AMOUNT_TR = str.maketrans({'.': None, ',': '.'})
+# Caracteres do fim de uma página que voltam a ser lidos com a página seguinte.
+_CARRY = 100
+
+
+def _total_priority(m):
+    # "Total a pagar" > "TOTAL ... €" > "TOTAL"; empates ficam com o primeiro.
+    if m.group('pagar'):
+        return 0
+    if m.group('euro'):
+        return 1
+    return 2
+
+
+def _find_total(text):
+    return min(_TOTAL_RE.finditer(text), key=_total_priority, default=None)
+
+
+def _parse_date(m):
+    try:
+        return datetime.strptime(m.group(1).replace('-', '/'), "%d/%m/%Y").date()
+    except Exception:
+        return None
+
+
+def _parse_amount(val):
+    try:
+        return float(val.translate(_AMOUNT_TR))
+    except Exception:
+        return None
+
+
+def extract_date_and_total(text: str):
+    date_match = _DATE_RE.search(text)
+    date = _parse_date(date_match) if date_match else None
+
+    total = None
+    m = _find_total(text)
+    if m:
+        total = _parse_amount(m.group('val'))
+
+    if total is None:
+        all_nums = _NUM_RE.findall(text)
+        if all_nums:
+            total = _parse_amount(all_nums[-1])
+
+    return date, total
+
+
+def iter_pages(file_bytes: bytes):
+    pdf = pdfium.PdfDocument(file_bytes)
+    try:
+        for page in pdf:
+            textpage = page.get_textpage()
+            try:
+                yield textpage.get_text_range()
+            finally:
+                textpage.close()
+                page.close()
+    finally:
+        pdf.close()
+
+
+def scan(file_bytes: bytes):
+    # Aplica as regras de extract_date_and_total ao documento, mas percorre cada
+    # página uma só vez: guarda a primeira data, o melhor total (em empate fica o
+    # da página anterior) e, enquanto não houver total, o último número. Pára
+    # assim que há data e um "Total a pagar", que nenhuma página pode superar.
+    # O fim da página anterior é lido outra vez com a seguinte, para apanhar um
+    # total cujo rótulo e valor ficaram em páginas diferentes.
+    date_match = best = last_num = None
+    carry = None
+    for page_text in iter_pages(file_bytes):
+        if date_match is None:
+            date_match = _DATE_RE.search(page_text)
+        text = page_text if carry is None else carry + "\n" + page_text
+        m = _find_total(text)
+        if m and (best is None or _total_priority(m) < _total_priority(best)):
+            best = m
+        if best is None:
+            nums = _NUM_RE.findall(page_text)
+            if nums:
+                last_num = nums[-1]
+        if date_match is not None and best is not None and _total_priority(best) == 0:
+            break
+        carry = text[-_CARRY:]
+
+    date = _parse_date(date_match) if date_match else None
+    total = _parse_amount(best.group('val')) if best else None
+    if total is None and last_num is not None:
+        total = _parse_amount(last_num)
+    return date, total
+
+
+def parse_one(item):
+    # Corre nos processos do ProcessPoolExecutor: recebe e devolve só tipos simples.
+    # Um PDF ilegível não pode abortar o lote: devolve o erro no último campo.
+    name, file_bytes = item
+    try:
+        date, total = scan(file_bytes)
+    except Exception as e:
+        return name, None, None, f"{type(e).__name__}: {e}"
+    return name, date, total, None
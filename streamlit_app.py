@@ -1,156 +1,127 @@
-import streamlit as st
-import pdfplumber
-import pandas as pd
-import re
-from io import BytesIO
-from datetime import datetime
-import sqlite3
-
-st.set_page_config(page_title="Faturas Continente", layout="wide")
-st.title("🧾 Registo de Gastos Continente")
-
-# -----------------------
-# Funções auxiliares
-# -----------------------
-
-def extract_text_from_pdf_bytes(file_bytes: bytes) -> str:
-    with pdfplumber.open(BytesIO(file_bytes)) as pdf:
-        texts = [p.extract_text() or "" for p in pdf.pages]
-    return "\n".join(texts)
-
-
-def extract_date_and_total(text: str):
-    date_match = re.search(r"(\d{2}[/-]\d{2}[/-]\d{4})", text)
-    date = None
-    if date_match:
-        try:
-            date = datetime.strptime(date_match.group(1).replace('-', '/'), "%d/%m/%Y").date()
-        except Exception:
-            date = None
-
-    patterns = [
-        r"Total a pagar\s*[:\-]?\s*([0-9]+[.,][0-9]{2})",
-        r"TOTAL\s*[:\-]?\s*([0-9]+[.,][0-9]{2})\s*€",
-        r"TOTAL\s*[:\-]?\s*([0-9]+[.,][0-9]{2})",
-        r"TOTAL A PAGAR\s*[:\-]?\s*([0-9]+[.,][0-9]{2})",
-        r"Valor total\s*[:\-]?\s*([0-9]+[.,][0-9]{2})",
-    ]
-
-    total = None
-    for p in patterns:
-        m = re.search(p, text, flags=re.IGNORECASE)
-        if m:
-            val = m.group(1)
-            try:
-                total = float(val.replace('.', '').replace(',', '.'))
-                break
-            except Exception:
-                continue
-
-    if total is None:
-        all_nums = re.findall(r"[0-9]+[.,][0-9]{2}", text)
-        if all_nums:
-            try:
-                total = float(all_nums[-1].replace('.', '').replace(',', '.'))
-            except Exception:
-                total = None
-
-    return date, total
-
-# -----------------------
-# Base de dados SQLite
-# -----------------------
-DB_PATH = "faturas_continente.db"
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-cur = conn.cursor()
-cur.execute("""
-CREATE TABLE IF NOT EXISTS receipts (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    date TEXT,
-    total REAL,
-    filename TEXT,
-    uploaded_at TEXT
-)
-""")
-conn.commit()
-
-def sqlite_insert(date_str, total, filename):
-    cur.execute("INSERT INTO receipts (date, total, filename, uploaded_at) VALUES (?, ?, ?, datetime('now'))",
-                (date_str, total, filename))
+# Os processos do ProcessPoolExecutor (spawn) voltam a executar este ficheiro
+# como __mp_main__; a aplicação só corre quando o Streamlit o executa como __main__.
+if __name__ == "__main__":
+    import streamlit as st
+    import pandas as pd
+    import sqlite3
+    import hashlib
+    import multiprocessing
+    import os
+    from concurrent.futures import ProcessPoolExecutor
+
+    from db_writer import DBWriter
+    from receipt_parsing import parse_one
+
+    st.set_page_config(page_title="Faturas Continente", layout="wide")
+    st.title("🧾 Registo de Gastos Continente")
+
+    # -----------------------
+    # Base de dados SQLite
+    # -----------------------
+    DB_PATH = "faturas_continente.db"
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    cur = conn.cursor()
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS receipts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date TEXT,
+        total REAL,
+        filename TEXT,
+        uploaded_at TEXT,
+        sha TEXT
+    )
+    """)
+    # Bases de dados criadas antes da coluna sha
+    if "sha" not in {row[1] for row in cur.execute("PRAGMA table_info(receipts)")}:
+        cur.execute("ALTER TABLE receipts ADD COLUMN sha TEXT")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_receipts_sha ON receipts(sha)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_receipts_filename ON receipts(filename)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_receipts_date ON receipts(date)")
     conn.commit()
 
-def sqlite_fetch_all():
-    df = pd.read_sql_query("SELECT date, total, filename, uploaded_at FROM receipts ORDER BY date", conn)
-    if not df.empty:
-        df['date'] = pd.to_datetime(df['date']).dt.date
-    return df
-
-# -----------------------
-# Menu superior (abas)
-# -----------------------
-tab1, tab2, tab3 = st.tabs(["📤 Inserir Faturas", "📈 Ver Gastos", "🗑️ Eliminar Faturas"])
-
-# -----------------------
-# Página: Inserir Faturas
-# -----------------------
-with tab1:
-    st.header("📤 Inserir novas faturas")
-
-    uploaded_files = st.file_uploader("Envia aqui as faturas PDF do Continente", type=["pdf"], accept_multiple_files=True)
-    if uploaded_files:
-        added = 0
-        errors = []
-        for up in uploaded_files:
-            raw = up.read()
-            text = extract_text_from_pdf_bytes(raw)
-            date, total = extract_date_and_total(text)
-
-            if date is None or total is None:
-                errors.append((up.name, date, total))
-                continue
-
-            date_str = date.strftime("%Y-%m-%d")
-            try:
-                sqlite_insert(date_str, total, up.name)
-                added += 1
-            except Exception as e:
-                errors.append((up.name, str(e)))
-
-        st.success(f"✅ {added} faturas processadas com sucesso.")
-        if errors:
-            st.warning("⚠️ Algumas faturas não foram processadas corretamente.")
-            st.write(errors)
-
-# -----------------------
-# Página: Ver Gastos
-# -----------------------
-with tab2:
-    st.header("📈 Visualização de gastos")
-
-    df = sqlite_fetch_all()
-    if df.empty:
-        st.info("Ainda não há faturas registadas.")
-    else:
-        df['date'] = pd.to_datetime(df['date'])
-        df['month'] = df['date'].dt.to_period('M').dt.to_timestamp()
-        df['year'] = df['date'].dt.year
-        df['total'] = df['total'].astype(float)
-
-        monthly = df.groupby('month')['total'].sum().reset_index()
-        yearly = df.groupby('year')['total'].sum().reset_index()
-
-        col1, col2 = st.columns([2, 1])
-        with col1:
-            st.subheader("Gasto por mês")
-            st.bar_chart(monthly.set_index('month'))
-        with col2:
-            st.subheader("Gasto por ano")
-            yearly_display = yearly.copy()
-            yearly_display["total"] = yearly_display["total"].apply(lambda x: f"{x:.2f} €")
-            yearly_display.rename(columns={"year": "Ano", "total": "Total (€)"}, inplace=True)
-            st.table(yearly_display)
-
-        st.subheader("📄 Detalhe das faturas")
+    # Segundos que a sessão espera pelo escritor antes de dar as escritas como falhadas.
+    WRITE_TIMEOUT = 30
+
+    # Um só escritor por processo, partilhado por todas as sessões; se a thread
+    # morrer, o Streamlit cria outro em vez de devolver o que está em cache.
+    @st.cache_resource(validate=lambda writer: writer.thread.is_alive())
+    def get_writer():
+        return DBWriter(DB_PATH)
+
+    writer = get_writer()
+
+    def sqlite_write(sql, rows):
+        # Uma mensagem de erro (ou None) por linha; se o escritor não responder, falham todas.
+        try:
+            results = writer.submit(sql, rows).result(timeout=WRITE_TIMEOUT)
+        except Exception as e:
+            return [str(e) or type(e).__name__] * len(rows)
+        return [None if e is None else str(e) for e in results]
+
+    def sqlite_insert_many(rows):
+        # Devolve as faturas que não foram gravadas (p.ex. a mesma fatura enviada
+        # entretanto por outra sessão), com o respetivo erro.
+        results = sqlite_write("INSERT INTO receipts (date, total, filename, uploaded_at, sha) VALUES (?, ?, ?, datetime('now'), ?)",
+                               rows)
+        return [(filename, e) for (_, _, filename, _), e in zip(rows, results) if e is not None]
+
+    def sqlite_has_sha(sha):
+        return conn.execute("SELECT 1 FROM receipts WHERE sha = ?", (sha,)).fetchone() is not None
+
+    def receipts_version():
+        # Muda a cada inserção ou eliminação; serve de chave às caches abaixo.
+        return conn.execute("SELECT COUNT(*), MAX(id) FROM receipts").fetchone()
+
+    @st.cache_data(ttl=60)
+    def sqlite_fetch_all(version):
+        rows = conn.execute("SELECT date, total, filename, uploaded_at FROM receipts ORDER BY date").fetchall()
+        df = pd.DataFrame.from_records(rows, columns=['date', 'total', 'filename', 'uploaded_at'])
+        df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d', cache=True)
+        df['total'] = df['total'].astype('float64')
+        return df
+
+    def load_receipts():
+        # DataFrame guardado na sessão; só volta à base de dados quando a versão muda.
+        version = receipts_version()
+        if st.session_state.get('receipts_version') != version:
+            st.session_state['receipts_df'] = sqlite_fetch_all(version)
+            st.session_state['receipts_version'] = version
+        return version, st.session_state['receipts_df']
+
+    def delete_receipt(filename):
+        # Callback do botão: corre antes do novo render, por isso dispensa o rerun.
+        [error] = sqlite_write("DELETE FROM receipts WHERE filename = ?", [(filename,)])
+        if error is not None:
+            st.session_state['delete_error'] = (filename, error)
+            return
+        df = st.session_state['receipts_df']
+        old_count, old_max_id = st.session_state['receipts_version']
+        deleted = df.index[df['filename'] == filename]
+        version = receipts_version()
+        # Só se pode corrigir o DataFrame no sítio se entretanto nenhuma outra sessão
+        # escreveu: nenhum id novo (AUTOINCREMENT nunca os reutiliza) e só faltam as
+        # linhas desta eliminação. Caso contrário, lê-se de novo a base de dados.
+        if version[0] == old_count - len(deleted) and (version[1] or 0) <= (old_max_id or 0):
+            df.drop(deleted, inplace=True)
+        else:
+            st.session_state['receipts_df'] = sqlite_fetch_all(version)
+        st.session_state['receipts_version'] = version
+        st.session_state['deleted_filename'] = filename
+
+    # _df fica fora da chave da cache: corresponde sempre à versão indicada.
+    @st.cache_data(ttl=60)
+    def compute_summaries(version, _df):
+        df = _df
+        monthly = df.groupby(pd.Grouper(key='date', freq='MS'))['total'].sum().rename_axis('month').reset_index()
+        yearly = df.groupby(df['date'].dt.year.rename('year'))['total'].sum().reset_index()
+
+        yearly_display = yearly.copy()
+        yearly_display["total"] = yearly_display["total"].apply(lambda x: f"{x:.2f} €")
+        yearly_display.rename(columns={"year": "Ano", "total": "Total (€)"}, inplace=True)
+
         df_sorted = df.sort_values('date', ascending=False).reset_index(drop=True)
         df_sorted["Comentário"] = df_sorted["total"].apply(
             lambda x: "Pago com saldo Cartão Continente" if x == 0 else ""
@@ -162,29 +133,116 @@ with tab2:
         df_display.rename(columns={"filename": "Ficheiro"}, inplace=True)
         df_display = df_display[["Data", "Valor (€)", "Ficheiro", "Comentário"]]
 
-        st.dataframe(df_display, use_container_width=True)
-
-        st.download_button("📥 Exportar CSV",
-                           data=df_display.to_csv(index=False).encode('utf-8'),
-                           file_name="faturas_continente.csv",
-                           mime='text/csv')
-
-# -----------------------
-# Página: Eliminar Faturas
-# -----------------------
-with tab3:
-    st.header("🗑️ Eliminar faturas")
-
-    df = sqlite_fetch_all()
-    if df.empty:
-        st.info("Não há faturas registadas.")
-    else:
-        selected_filename = st.selectbox(
-            "Escolhe o ficheiro a eliminar:",
-            options=df["filename"].tolist()
-        )
-        if st.button("Eliminar fatura selecionada"):
-            cur.execute("DELETE FROM receipts WHERE filename = ?", (selected_filename,))
-            conn.commit()
-            st.success(f"Fatura '{selected_filename}' eliminada com sucesso.")
-            st.experimental_rerun()
+        return monthly, yearly_display, df_display
+
+    # -----------------------
+    # Menu superior (abas)
+    # -----------------------
+    tab1, tab2, tab3 = st.tabs(["📤 Inserir Faturas", "📈 Ver Gastos", "🗑️ Eliminar Faturas"])
+
+    # -----------------------
+    # Página: Inserir Faturas
+    # -----------------------
+    with tab1:
+        st.header("📤 Inserir novas faturas")
+
+        uploaded_files = st.file_uploader("Envia aqui as faturas PDF do Continente", type=["pdf"], accept_multiple_files=True)
+        if uploaded_files:
+            added = 0
+            errors = []
+            skipped = 0
+            rows = []
+            items = []
+            shas = []
+            seen = set()
+            for up in uploaded_files:
+                raw = up.getvalue()
+                # Faturas já registadas (ou repetidas neste lote) não voltam a ser lidas.
+                sha = hashlib.blake2b(raw, digest_size=16).hexdigest()
+                if sha in seen or sqlite_has_sha(sha):
+                    skipped += 1
+                    continue
+                items.append((up.name, raw))
+                shas.append(sha)
+                seen.add(sha)
+
+            if len(items) > 1:
+                # spawn: fazer fork de um processo com threads (Tornado, db-writer) pode bloquear os filhos.
+                with ProcessPoolExecutor(max_workers=min(len(items), os.cpu_count() or 1),
+                                         mp_context=multiprocessing.get_context("spawn")) as ex:
+                    results = list(ex.map(parse_one, items))
+            else:
+                results = [parse_one(item) for item in items]
+
+            for sha, (name, date, total, error) in zip(shas, results):
+                if error is not None:
+                    errors.append((name, error))
+                    continue
+                if date is None or total is None:
+                    errors.append((name, date, total))
+                    continue
+
+                rows.append((date.strftime("%Y-%m-%d"), total, name, sha))
+
+            if rows:
+                failed = sqlite_insert_many(rows)
+                added = len(rows) - len(failed)
+                errors.extend(failed)
+
+            st.success(f"✅ {added} faturas processadas com sucesso.")
+            if skipped:
+                st.info(f"ℹ️ {skipped} faturas já estavam registadas e foram ignoradas.")
+            if errors:
+                st.warning("⚠️ Algumas faturas não foram processadas corretamente.")
+                st.write(errors)
+
+    # -----------------------
+    # Página: Ver Gastos
+    # -----------------------
+    with tab2:
+        st.header("📈 Visualização de gastos")
+
+        version, df = load_receipts()
+        if df.empty:
+            st.info("Ainda não há faturas registadas.")
+        else:
+            monthly, yearly_display, df_display = compute_summaries(version, df)
+
+            col1, col2 = st.columns([2, 1])
+            with col1:
+                st.subheader("Gasto por mês")
+                st.bar_chart(monthly.set_index('month'))
+            with col2:
+                st.subheader("Gasto por ano")
+                st.table(yearly_display)
+
+            st.subheader("📄 Detalhe das faturas")
+            st.dataframe(df_display, use_container_width=True)
+
+            st.download_button("📥 Exportar CSV",
+                               data=df_display.to_csv(index=False).encode('utf-8'),
+                               file_name="faturas_continente.csv",
+                               mime='text/csv')
+
+    # -----------------------
+    # Página: Eliminar Faturas
+    # -----------------------
+    with tab3:
+        st.header("🗑️ Eliminar faturas")
+
+        deleted_filename = st.session_state.pop('deleted_filename', None)
+        if deleted_filename is not None:
+            st.success(f"Fatura '{deleted_filename}' eliminada com sucesso.")
+        delete_error = st.session_state.pop('delete_error', None)
+        if delete_error is not None:
+            st.error(f"Não foi possível eliminar a fatura '{delete_error[0]}': {delete_error[1]}")
+
+        _, df = load_receipts()
+        if df.empty:
+            st.info("Não há faturas registadas.")
+        else:
+            selected_filename = st.selectbox(
+                "Escolhe o ficheiro a eliminar:",
+                options=df["filename"].tolist()
+            )
+            st.button("Eliminar fatura selecionada", on_click=delete_receipt, args=(selected_filename,))
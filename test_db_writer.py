@@ -0,0 +1,121 @@
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import pytest
+
+from db_writer import DBWriter
+
+INSERT = "INSERT INTO r (a, b) VALUES (?, ?)"
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / "faturas.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE r (a INTEGER, b TEXT UNIQUE)")
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def writer(db_path):
+    return DBWriter(db_path)
+
+
+def rows_in(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return sorted(a for (a,) in conn.execute("SELECT a FROM r"))
+
+
+@contextmanager
+def paused(writer, db_path):
+    # Segura o lock de escrita: o escritor fica preso numa primeira escrita e o
+    # que for submetido entretanto acumula-se na fila, formando um só lote.
+    lock = sqlite3.connect(db_path, isolation_level=None)
+    lock.execute("BEGIN EXCLUSIVE")
+    primer = writer.submit(INSERT, [(0, None)])
+    while not writer.queue.empty():
+        time.sleep(0.01)
+    try:
+        yield
+    finally:
+        lock.execute("COMMIT")
+        lock.close()
+    assert primer.result(timeout=5) == [None]
+
+
+def test_merges_submissions_into_one_transaction(writer, db_path):
+    statements = []
+    writer.conn.set_trace_callback(statements.append)
+
+    with paused(writer, db_path):
+        futures = [writer.submit(INSERT, [(i, f"b{i}")]) for i in range(1, 6)]
+    assert [f.result(timeout=5) for f in futures] == [[None]] * 5
+
+    # A escrita que segurou o escritor e, depois, um só lote com as cinco.
+    assert sum(s.strip().upper() == "COMMIT" for s in statements) == 2
+    assert rows_in(db_path) == [0, 1, 2, 3, 4, 5]
+
+
+def test_unique_conflict_rejects_only_the_bad_row(writer, db_path):
+    with paused(writer, db_path):
+        first = writer.submit(INSERT, [(1, "x"), (2, "x"), (3, "y")])
+        second = writer.submit(INSERT, [(4, "z")])
+
+    results = first.result(timeout=5)
+    assert results[0] is None and results[2] is None
+    assert isinstance(results[1], sqlite3.IntegrityError)
+    assert second.result(timeout=5) == [None]
+    assert rows_in(db_path) == [0, 1, 3, 4]
+
+
+def test_results_follow_submission_order(writer, db_path):
+    writer.submit(INSERT, [(1, "dup")]).result(timeout=5)
+
+    with paused(writer, db_path):
+        futures = [
+            writer.submit(INSERT, [(2, "dup"), (3, "c")]),
+            writer.submit(INSERT, [(4, "d"), (5, "c"), (6, "dup")]),
+            writer.submit(INSERT, [(7, "g")]),
+        ]
+
+    failed = [[e is not None for e in f.result(timeout=5)] for f in futures]
+    assert failed == [[True, False], [False, True, True], [False]]
+    assert rows_in(db_path) == [0, 1, 3, 4, 7]
+
+
+def test_delete_mixed_into_insert_batch(writer, db_path):
+    writer.submit(INSERT, [(1, "a")]).result(timeout=5)
+
+    with paused(writer, db_path):
+        futures = [
+            writer.submit(INSERT, [(2, "b")]),
+            writer.submit("DELETE FROM r WHERE a = ?", [(1,)]),
+            writer.submit(INSERT, [(3, "c")]),
+        ]
+
+    assert [f.result(timeout=5) for f in futures] == [[None]] * 3
+    assert rows_in(db_path) == [0, 2, 3]
+
+
+def test_invalid_path_fails_on_creation(tmp_path):
+    with pytest.raises(sqlite3.OperationalError):
+        DBWriter(tmp_path / "nao-existe" / "faturas.db")
+
+
+def test_unexpected_error_fails_pending_futures(writer, db_path):
+    def broken(conn, batch):
+        raise RuntimeError("falha inesperada")
+
+    original = writer._write_batch
+    writer._write_batch = broken
+    with pytest.raises(RuntimeError, match="falha inesperada"):
+        writer.submit(INSERT, [(1, "a")]).result(timeout=5)
+
+    # A thread sobrevive e continua a gravar.
+    writer._write_batch = original
+    assert writer.thread.is_alive()
+    assert writer.submit(INSERT, [(2, "b")]).result(timeout=5) == [None]
+    assert rows_in(db_path) == [2]
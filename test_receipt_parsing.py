@@ -0,0 +1,139 @@
+import random
+import re
+from datetime import datetime
+
+import pytest
+
+import receipt_parsing
+from receipt_parsing import extract_date_and_total
+
+
+def baseline_extract_date_and_total(text):
+    # Versão original (padrões testados um a um), usada como referência.
+    date_match = re.search(r"(\d{2}[/-]\d{2}[/-]\d{4})", text)
+    date = None
+    if date_match:
+        try:
+            date = datetime.strptime(date_match.group(1).replace('-', '/'), "%d/%m/%Y").date()
+        except Exception:
+            date = None
+
+    patterns = [
+        r"Total a pagar\s*[:\-]?\s*([0-9]+[.,][0-9]{2})",
+        r"TOTAL\s*[:\-]?\s*([0-9]+[.,][0-9]{2})\s*€",
+        r"TOTAL\s*[:\-]?\s*([0-9]+[.,][0-9]{2})",
+        r"TOTAL A PAGAR\s*[:\-]?\s*([0-9]+[.,][0-9]{2})",
+        r"Valor total\s*[:\-]?\s*([0-9]+[.,][0-9]{2})",
+    ]
+
+    total = None
+    for p in patterns:
+        m = re.search(p, text, flags=re.IGNORECASE)
+        if m:
+            val = m.group(1)
+            try:
+                total = float(val.replace('.', '').replace(',', '.'))
+                break
+            except Exception:
+                continue
+
+    if total is None:
+        all_nums = re.findall(r"[0-9]+[.,][0-9]{2}", text)
+        if all_nums:
+            try:
+                total = float(all_nums[-1].replace('.', '').replace(',', '.'))
+            except Exception:
+                total = None
+
+    return date, total
+
+
+CONTINENTE_RECEIPT = """\
+MODELO CONTINENTE HIPERMERCADOS, S.A.
+Continente Colombo
+Fatura Simplificada FS 0123/456789   12/03/2024 18:42
+LEITE MEIO GORDO 1L            0,89
+PAO DE FORMA                   1,49
+IOGURTE NATURAL X4             1,99
+Subtotal                       4,37
+TOTAL A PAGAR                 25,30 €
+Cartão Continente: Saldo utilizado 0,00
+Poupança acumulada             1,20
+IVA 6% Base 3,88 IVA 0,23
+IVA 23% Base 17,00 IVA 3,91
+Valor total                   25,30
+"""
+
+SAMPLES = [
+    CONTINENTE_RECEIPT,
+    "12/03/2024\nTotal a pagar: 25,30\nValor total 3,00",
+    "12/03/2024\nTotal a pagar: 25,30\n" + "x" * 200 + "\nSubtotal 3,50",
+    "01-01-2024 TOTAL 10,00 €\nTOTAL 2,00",
+    "01/01/2024 Subtotal 7,10\nTOTAL: 7,10",
+    "05/06/2023 Valor total - 9,99",
+    "05/06/2023 sem palavra-chave 1,00 2,00 3,50",
+    "99/99/2024 TOTAL 1,00",
+    "TOTAL 12.34",
+    "sem data nem valores",
+    "",
+]
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_extract_matches_baseline(text):
+    assert extract_date_and_total(text) == baseline_extract_date_and_total(text)
+
+
+def test_total_a_pagar_wins_over_later_lines():
+    assert extract_date_and_total(CONTINENTE_RECEIPT)[1] == 25.30
+
+
+def test_extract_matches_baseline_on_random_text():
+    tokens = ["Total a pagar", "TOTAL A PAGAR", "Valor total", "TOTAL", "Subtotal",
+              "IVA", ": ", "-", " ", "\n", "12,34", "5.00", "0,99", " €",
+              "01/02/2024", "x" * 40, "x" * 120]
+    rng = random.Random(0)
+    for _ in range(20000):
+        text = "".join(rng.choice(tokens) for _ in range(rng.randint(1, 14)))
+        assert extract_date_and_total(text) == baseline_extract_date_and_total(text), text
+
+
+@pytest.mark.parametrize("val", ["25,30", "0,00", "1234,56", "12.34", "7.05"])
+def test_parse_amount_matches_chained_replace(val):
+    assert receipt_parsing._parse_amount(val) == float(val.replace('.', '').replace(',', '.'))
+
+
+@pytest.mark.parametrize("pages", [
+    ["12/03/2024 TOTAL 3,00", "Total a pagar 25,30", "IVA 1,00"],
+    ["12/03/2024 Subtotal 3,00", "Valor total 4,00"],
+    ["sem data 1,00", "02/03/2024 2,00 3,00", "nada"],
+    ["12/03/2024 Total a pagar 25,30", "Total a pagar 1,00"],
+    ["12/03/2024\nSubtotal 3,00\nTotal a pagar:", "25,30 €\nIVA 0,50"],
+    ["12/03/2024 TOTAL 3,00", " €"],
+    ["12/03/2024 Total a pagar", "", "25,30"],
+    ["", ""],
+])
+def test_scan_matches_baseline_on_joined_pages(monkeypatch, pages):
+    monkeypatch.setattr(receipt_parsing, "iter_pages", lambda file_bytes: iter(pages))
+    assert receipt_parsing.scan(b"") == baseline_extract_date_and_total("\n".join(pages))
+
+
+def test_scan_matches_baseline_on_random_pages(monkeypatch):
+    tokens = ["Total a pagar", "TOTAL A PAGAR", "Valor total", "TOTAL", "Subtotal",
+              "IVA", ": ", "-", " ", "\n", "12,34", "5.00", "0,99", " €",
+              "01/02/2024", "x" * 40]
+    rng = random.Random(0)
+    for _ in range(5000):
+        pages = ["".join(rng.choice(tokens) for _ in range(rng.randint(0, 8)))
+                 for _ in range(rng.randint(1, 4))]
+        monkeypatch.setattr(receipt_parsing, "iter_pages", lambda file_bytes: iter(pages))
+        assert receipt_parsing.scan(b"") == baseline_extract_date_and_total("\n".join(pages)), pages
+
+
+def test_parse_one_reports_unreadable_pdf(monkeypatch):
+    def broken(file_bytes):
+        raise ValueError("PDF inválido")
+        yield
+
+    monkeypatch.setattr(receipt_parsing, "iter_pages", broken)
+    assert receipt_parsing.parse_one(("fatura.pdf", b"lixo")) == ("fatura.pdf", None, None, "ValueError: PDF inválido")